@@ -2,8 +2,10 @@
 """
 control_code.py  v1.5
 ────────────────────────────────────────────────────────────
-• Collects student repo name from CLI
-• Reads *all* source files under ~/logs/studentcode  (language-agnostic)
+• Collects student repo name(s) from CLI — several names are batched, each
+  read from ~/logs/<repo_name>/ and sent to Ollama concurrently
+• Reads *all* text files under ~/logs/studentcode  (language-agnostic;
+  binaries, files > 256 KB, hidden and vendored dirs skipped)
 • Detects perfect autograder scores
 • Retrieves last 3 teacher-reviewed comments for the repo
 • Loads system prompts from /prompts (external to code) via PromptStore
@@ -11,7 +13,7 @@ control_code.py  v1.5
 • Writes markdown feedback to ~/logs/feedback.md
 • Persists rows into:
 
-    submissions      (legacy `code` column kept)
+    submissions      (`code` = sha256 of the code blob; see Repo.get_submission_code)
     code_files       (one row per file)
     autograder_outputs
     feedback         (repo_name + reviewed flag)
@@ -19,9 +21,15 @@ control_code.py  v1.5
 SQLite path defaults to $HOME/agllmdatabase.db (overridable with $AGLLM_DB).
 """
 
-import os, sys, sqlite3, subprocess, shutil, re, json, requests
+import os, sys, sqlite3, subprocess, shutil, re, json, threading, hashlib, requests
 from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from dataclasses import dataclass
 from datetime import datetime
+from itertools import islice
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from prompt_store import PromptStore  # ability to change prompts
 
 # ─────────────────────────── config ─────────────────────────────
@@ -33,99 +41,349 @@ README_FILE      = LOGS_DIR / "README.md"
 FEEDBACK_MD      = LOGS_DIR / "feedback.md"
 ASSIGNMENT_ID    = 101
 TEST_ID          = 1001          # reserved for future use
+READ_WORKERS     = 32            # max threads reading student files
+MAX_FILE_BYTES   = 256 * 1024    # larger files are skipped (generated / data)
+
+# Known-binary student files are skipped by extension; anything else whose first
+# _SNIFF_BYTES contain a NUL byte is dropped after reading
+_BINARY_EXT = (".o", ".obj", ".a", ".so", ".dll", ".dylib", ".exe", ".out",
+               ".class", ".jar", ".pyc", ".pyo", ".whl",
+               ".png", ".jpg", ".jpeg", ".gif", ".bmp", ".ico", ".pdf",
+               ".zip", ".tar", ".gz", ".tgz", ".bz2", ".xz", ".7z",
+               ".db", ".sqlite", ".bin", ".mp3", ".mp4", ".wav",
+               ".ttf", ".woff", ".woff2")
+_SNIFF_BYTES = 8192
+_SKIP_DIRS = {"node_modules", "__pycache__"}
 
 # Make model env-driven (fallback preserved)
 OLLAMA_MODEL     = os.getenv("OLLAMA_MODEL", "gpt-oss")
 OLLAMA_HOST      = os.getenv("OLLAMA_HOST", "http://molly.cs.wcupa.edu:11434") # default http://ollama:11434 Also Change your Host IP on the docker compose !!
+OLLAMA_NUM_PARALLEL = int(os.getenv("OLLAMA_NUM_PARALLEL", "4"))  # concurrent generate calls
+OLLAMA_NUM_PREDICT  = os.getenv("OLLAMA_NUM_PREDICT")               # unset → unbounded (reasoning models)
+OLLAMA_MAX_CTX      = int(os.getenv("OLLAMA_MAX_CTX", "32768"))       # num_ctx upper bound
+OLLAMA_MIN_OUTPUT_TOKENS = int(os.getenv("OLLAMA_MIN_OUTPUT_TOKENS", "8192"))  # thinking + answer room
+OLLAMA_TEMPERATURE  = float(os.getenv("OLLAMA_TEMPERATURE", "0.2"))
 
 # System prompt filenames (can be overridden by env)
 PROMPT_PERFECT   = os.getenv("PROMPT_PERFECT", "system_perfect.md")
 PROMPT_DEFAULT   = os.getenv("PROMPT_DEFAULT", "system_default.md")
 
+# Autograder summary line, e.g. "Points 10/10"
+_POINTS_RE = re.compile(r"Points\s+(\d+)\s*/\s*(\d+)", re.I)
+_POINTS_MIN_LEN = len("Points 0/0")   # shortest text the pattern can match
+_POINTS_TAIL     = 2048                # summary sits at the end of the log
+
+# Shared HTTP session: keep-alive + pooled connections to Ollama across calls
+_SESSION = requests.Session()
+_SESSION.mount("http://", HTTPAdapter(pool_connections=1, pool_maxsize=max(4, OLLAMA_NUM_PARALLEL),
+                                      max_retries=Retry(total=2, backoff_factor=0.3)))
+_SESSION.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=max(4, OLLAMA_NUM_PARALLEL),
+                                       max_retries=Retry(total=2, backoff_factor=0.3)))
+
 # ─────────────────────────── helpers ────────────────────────────
+class ControlCodeError(Exception):
+    """Fatal problem with a run or a single repo; the CLI maps it to exit 1."""
+
 def err(msg: str):
-    print(f"❌ {msg}", file=sys.stderr)
-    sys.exit(1)
+    raise ControlCodeError(msg)
 
 def read_file(path: Path) -> str:
-    for enc in ("utf-8", "ISO-8859-1"):
-        try:
-            return path.read_text(encoding=enc)
-        except UnicodeDecodeError:
-            continue
-    print(f"Warning: could not decode {path.name}")
-    return ""
-
-def run_ollama(prompt: str) -> str:
-    """Call the Ollama REST API instead of the CLI."""
+    return _decode(path.read_bytes())   # one read; decode at most twice, never re-read
+
+def read_source(path: Path) -> str | None:
+    """read_file for student code: None if the file looks binary."""
+    data = path.read_bytes()
+    if b"\0" in data[:_SNIFF_BYTES]:
+        return None
+    return _decode(data)
+
+def _decode(data: bytes) -> str:
+    try:
+        text = data.decode("utf-8")
+    except UnicodeDecodeError:
+        text = data.decode("ISO-8859-1", errors="replace")
+    # universal newlines, as Path.read_text did
+    return text.replace("\r\n", "\n").replace("\r", "\n")
+
+def _scandir_recursive(path):
+    """Yield source-file DirEntry objects under *path*, reusing scandir's cached metadata.
+
+    Hidden entries, vendored dirs, known-binary extensions and files over
+    MAX_FILE_BYTES are skipped so they never reach the prompt or the DB.
+    Unreadable directories are skipped, as Path.rglob did.
+    """
+    try:
+        it = os.scandir(path)
+    except PermissionError:
+        return
+    with it:
+        for entry in it:
+            if entry.is_symlink() or entry.name.startswith("."):
+                continue
+            if entry.is_file():
+                if (not entry.name.lower().endswith(_BINARY_EXT)
+                        and entry.stat().st_size <= MAX_FILE_BYTES):
+                    yield entry
+            elif entry.is_dir() and entry.name not in _SKIP_DIRS:
+                yield from _scandir_recursive(entry.path)
+
+def ollama_options(prompts: list) -> dict:
+    """Options shared by every request of a run.
+
+    One num_ctx for all prompts (the largest need, rounded up to a power of two and
+    capped at OLLAMA_MAX_CTX): Ollama reloads the model whenever num_ctx changes,
+    which would serialise a batch. Tokens are estimated at ≈3 chars each (source
+    code tokenises densely) plus OLLAMA_MIN_OUTPUT_TOKENS for thinking + answer.
+    """
+    needed  = max(len(p) for p in prompts) // 3 + OLLAMA_MIN_OUTPUT_TOKENS
+    num_ctx = min(OLLAMA_MAX_CTX, max(2048, 1 << (needed - 1).bit_length()))
+    if needed > num_ctx:
+        print(f"⚠️  Prompt needs ≈{needed} tokens but num_ctx is capped at {num_ctx} "
+              "(OLLAMA_MAX_CTX); Ollama may truncate it", file=sys.stderr)
+    options = {
+        "num_ctx":     num_ctx,
+        "temperature": OLLAMA_TEMPERATURE,
+    }
+    if OLLAMA_NUM_PREDICT:
+        options["num_predict"] = int(OLLAMA_NUM_PREDICT)
+    return options
+
+def run_ollama(prompt: str, options: dict | None = None) -> str:
+    """Call the Ollama REST API instead of the CLI (streamed NDJSON)."""
     url = f"{OLLAMA_HOST.rstrip('/')}/api/generate"
     payload = {
         "model":  OLLAMA_MODEL,
         "prompt": prompt,
-        "stream": False          # single JSON response
+        "stream": True           # one JSON object per line until done
     }
+    if options:
+        payload["options"] = options
     try:
-        r = requests.post(url, json=payload, timeout=600)
-        r.raise_for_status()
-        return r.json()["response"]
+        chunks = []
+        final  = None
+        with _SESSION.post(url, json=payload, timeout=600, stream=True) as r:
+            r.raise_for_status()
+            for line in r.iter_lines():
+                if not line:
+                    continue
+                msg = json.loads(line)
+                if "error" in msg:
+                    raise RuntimeError(msg["error"])
+                chunks.append(msg.get("response", ""))
+                if msg.get("done"):
+                    final = msg
+                    break
+        if final is None:
+            raise RuntimeError("stream ended before generation finished (no done message)")
+        if final.get("done_reason") == "length":
+            print("⚠️  Ollama stopped at the token limit — feedback may be truncated",
+                  file=sys.stderr)
+        return "".join(chunks)
     except Exception as e:
         err(f"Ollama API error ⇒ {e}")
 
 def is_perfect_score(text: str) -> bool:
     """True if autograder gave full marks."""
+    if len(text) < _POINTS_MIN_LEN:   # empty / missing autograder output
+        return False
     if "All tests passed" in text:
         return True
-    m = re.search(r"Points\s+(\d+)\s*/\s*(\d+)", text, re.I)
+    tail = text[-_POINTS_TAIL:] if len(text) > _POINTS_TAIL else text
+    m = _POINTS_RE.search(tail)
     return bool(m and m.group(1) == m.group(2))
 
+# ─────────────────────────── database ───────────────────────────
+class Repo:
+    """SQLite access through one lazily opened WAL connection.
+
+    Statements are fixed strings, so sqlite3's per-connection statement cache
+    parses each one once per process and reuses it afterwards.
+    """
+
+    SQL_RECENT_FEEDBACK = """
+        SELECT teacher_comments
+          FROM feedback INDEXED BY idx_feedback_repo_reviewed
+         WHERE repo_name = ? AND reviewed = 1
+     ORDER BY reviewed_at DESC
+         LIMIT ?
+        """
+    # history lookup becomes an index seek returning ≤ LIMIT rows, no sort
+    SQL_FEEDBACK_INDEX = """
+        CREATE INDEX IF NOT EXISTS idx_feedback_repo_reviewed
+            ON feedback(repo_name, reviewed, reviewed_at DESC)
+        """
+    SQL_SUBMISSION = """INSERT INTO submissions
+                          (student_repo, assignment_id, code, submitted_at)
+                        VALUES (?,?,?,?)"""
+    SQL_CODE_FILES = "INSERT INTO code_files(submission_id, filename, code) VALUES "
+    CODE_FILES_CHUNK = 300   # 3 params/row → 900 bound variables per statement
+    SQL_SUBMISSION_FILES = """
+        SELECT filename, code
+          FROM code_files
+         WHERE submission_id = ?
+     ORDER BY filename
+        """
+    SQL_AUTOGRADER = ("INSERT INTO autograder_outputs(submission_id, output, generated_at) "
+                      "VALUES (?,?,?)")
+    SQL_FEEDBACK   = """INSERT INTO feedback
+                            (submission_id, repo_name, feedback_text, generated_at)
+                        VALUES (?,?,?,?)"""
+    # undo phase-1 rows of a submission whose feedback never arrived
+    SQL_DELETE_SUBMISSION = (
+        "DELETE FROM code_files WHERE submission_id = ?",
+        "DELETE FROM autograder_outputs WHERE submission_id = ?",
+        "DELETE FROM submissions WHERE rowid = ?",   # matches cursor.lastrowid
+    )
+
+    def __init__(self, path: str = DB_PATH):
+        self.path  = path
+        self._conn: sqlite3.Connection | None = None
+
+    @property
+    def conn(self) -> sqlite3.Connection:
+        if self._conn is None:
+            # isolation_level=None: transactions are explicit (see transaction()).
+            # check_same_thread=False: phase-1 inserts run on a worker thread; callers
+            # never use the connection from two threads at once.
+            conn = sqlite3.connect(self.path, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA cache_size=-65536")   # 64 MiB page cache
+            conn.execute("PRAGMA temp_store=MEMORY")
+            conn.execute(self.SQL_FEEDBACK_INDEX)
+            self._conn = conn
+        return self._conn
+
+    @contextmanager
+    def transaction(self):
+        """BEGIN … COMMIT, or ROLLBACK if the block raises."""
+        self.conn.execute("BEGIN")
+        try:
+            yield
+            self.conn.execute("COMMIT")
+        except BaseException:
+            # SQLite may already have rolled back (IOERR, FULL, …); a bare
+            # ROLLBACK would then raise and mask the original error
+            if self.conn.in_transaction:
+                self.conn.execute("ROLLBACK")
+            raise
+
+    def recent_feedback(self, repo_name: str, limit: int = 3) -> list:
+        rows = self.conn.execute(self.SQL_RECENT_FEEDBACK, (repo_name, limit)).fetchall()
+        return [row[0] for row in rows]
+
+    def insert_submission(self, repo_name: str, code: str, ts: str) -> int:
+        return self.conn.execute(
+            self.SQL_SUBMISSION, (repo_name, ASSIGNMENT_ID, code, ts)
+        ).lastrowid
+
+    def get_submission_code(self, submission_id: int) -> str:
+        """Rebuild a submission's full code blob (as sent to the model) from code_files."""
+        rows = self.conn.execute(self.SQL_SUBMISSION_FILES, (submission_id,)).fetchall()
+        return "".join(f"File: {name}\n{code}\n\n" for name, code in rows)
+
+    def insert_code_files(self, rows) -> None:
+        """Insert (submission_id, filename, code) rows with multi-row VALUES statements.
+
+        Chunks of CODE_FILES_CHUNK rows keep the bound parameters under SQLite's
+        999-variable limit; every full chunk reuses the same cached statement.
+        """
+        it = iter(rows)
+        while chunk := list(islice(it, self.CODE_FILES_CHUNK)):
+            sql = self.SQL_CODE_FILES + ",".join(["(?,?,?)"] * len(chunk))
+            self.conn.execute(sql, [v for row in chunk for v in row])
+
+    def insert_autograder_output(self, submission_id: int, output: str, ts: str) -> None:
+        self.conn.execute(self.SQL_AUTOGRADER, (submission_id, output, ts))
+
+    def insert_feedback(self, rows) -> None:
+        self.conn.executemany(self.SQL_FEEDBACK, rows)
+
+    def delete_submissions(self, submission_ids) -> None:
+        """Remove the phase-1 rows (code_files, autograder_outputs, submissions)."""
+        ids = [(sid,) for sid in submission_ids]
+        with self.transaction():
+            for sql in self.SQL_DELETE_SUBMISSION:
+                self.conn.executemany(sql, ids)
+
+    def close(self) -> None:
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+_DB = Repo(DB_PATH)
+
 # ─────────────────────────── main flow ──────────────────────────
-def main() -> None:
-    # 0️⃣ repo name
-    if len(sys.argv) < 2:
-        err("Usage: control_code.py <repo_name>")
-    repo_name = sys.argv[1]
+@dataclass
+class PromptBundle:
+    """Everything gathered for one repo, plus what the pipeline adds later."""
+    repo_name:         str
+    code_dir:          Path
+    feedback_md:       Path
+    code_files:        list
+    contents:          dict
+    student_code_blob: str
+    autograder_out:    str
+    prompt:            str
+    feedback_text:     str = ""
+    submission_id:     int | None = None
+    error:             str | None = None   # set when generation failed
+
+def process_repo(repo_name: str, db: Repo, store: PromptStore,
+                 base_dir: Path = LOGS_DIR) -> PromptBundle:
+    """Gather files, autograder output and history for *repo_name*; build its prompt.
+
+    *base_dir* holds studentcode/, autograder_output.txt, README.md and feedback.md.
+    """
+    code_dir    = base_dir / STUDENT_CODE_DIR.name
+    auto_file   = base_dir / AUTO_FILE.name
+    readme_file = base_dir / README_FILE.name
 
     # 1️⃣ gather every file in studentcode/
-    if not STUDENT_CODE_DIR.is_dir():
-        err(f"{STUDENT_CODE_DIR} not found")
-    code_files = sorted(
-        p for p in STUDENT_CODE_DIR.rglob("*")
-        if p.is_file() and not p.name.startswith(".")
-    )
+    if not code_dir.is_dir():
+        err(f"{code_dir} not found")
+    try:
+        code_files = [
+            Path(e.path)
+            for e in sorted(_scandir_recursive(code_dir), key=lambda e: e.path)
+        ]
+        if not code_files:
+            err(f"No files found in {code_dir}")
+
+        # read each file once (concurrently — pure I/O wait); reused for the prompt
+        # blob and the code_files rows. Binary files (None) are dropped here.
+        with ThreadPoolExecutor(max_workers=min(READ_WORKERS, len(code_files))) as ex:
+            contents = {
+                p: text
+                for p, text in zip(code_files, ex.map(read_source, code_files))
+                if text is not None
+            }
+    except OSError as e:   # vanished / unreadable file — skip the repo, not the batch
+        err(f"Could not read student code in {code_dir}: {e}")
+    code_files = [p for p in code_files if p in contents]
     if not code_files:
-        err(f"No files found in {STUDENT_CODE_DIR}")
+        err(f"No text files found in {code_dir}")
 
-    student_code_blob = ""
+    parts = []
     for p in code_files:
-        student_code_blob += f"File: {p.relative_to(STUDENT_CODE_DIR)}\n"
-        student_code_blob += read_file(p) + "\n\n"
+        parts.append(f"File: {p.relative_to(code_dir)}\n")
+        parts.append(contents[p])
+        parts.append("\n\n")
+    student_code_blob = "".join(parts)
 
-    autograder_out   = read_file(AUTO_FILE)   if AUTO_FILE.exists() else ""
-    professor_instr  = read_file(README_FILE) if README_FILE.exists() else ""
+    try:
+        autograder_out   = read_file(auto_file)   if auto_file.exists() else ""
+        professor_instr  = read_file(readme_file) if readme_file.exists() else ""
+    except OSError as e:
+        err(f"Could not read autograder output / README: {e}")
 
     perfect          = is_perfect_score(autograder_out)
 
-    # 2️⃣  DB connection (for history + later inserts)
-    ts   = datetime.utcnow().isoformat() + "Z"
-    conn = sqlite3.connect(DB_PATH)
-    cur  = conn.cursor()
-
-    # pull last 3 reviewed teacher comments
-    past_fb = cur.execute(
-        """
-        SELECT teacher_comments
-          FROM feedback
-         WHERE repo_name = ? AND reviewed = 1
-     ORDER BY reviewed_at DESC
-         LIMIT 3
-        """,
-        (repo_name,),
-    ).fetchall()
-    prior_feedback = "\n\n".join(row[0] for row in past_fb if row[0]) or "None so far."
+    # 2️⃣ pull last 3 reviewed teacher comments
+    past_fb = db.recent_feedback(repo_name)
+    prior_feedback = "\n\n".join(c for c in past_fb if c) or "None so far."
 
     # 3️⃣  build prompt (system header loaded from /prompts via PromptStore)
-    store = PromptStore()  # uses PROMPTS_DIR (e.g., /app/prompts in Docker, $HOME/prompts in Actions)
-
     try:
         if perfect:
             system_prompt = store.read(PROMPT_PERFECT)
@@ -167,54 +425,154 @@ def main() -> None:
     #print(prompt)
     #print("=== END FULL PROMPT ===")
 
-    # 4️⃣ call LLM
-    feedback_text = run_ollama(prompt)
-
-    # 5️⃣ write markdown (for GitHub commit)
-    FEEDBACK_MD.write_text(f"# Feedback for {repo_name}\n\n{feedback_text}",
-                           encoding="utf-8")
-    print(f"📄  Feedback saved → {FEEDBACK_MD}")
-
-    # 6️⃣  insert DB rows
-    try:
-        # submissions row (legacy full blob)
-        cur.execute(
-            """INSERT INTO submissions
-                 (student_repo, assignment_id, code, submitted_at)
-               VALUES (?,?,?,?)""",
-            (repo_name, ASSIGNMENT_ID, student_code_blob, ts)
-        )
-        submission_id = cur.lastrowid
+    return PromptBundle(
+        repo_name=repo_name,
+        code_dir=code_dir,
+        feedback_md=base_dir / FEEDBACK_MD.name,
+        code_files=code_files,
+        contents=contents,
+        student_code_blob=student_code_blob,
+        autograder_out=autograder_out,
+        prompt=prompt,
+    )
 
-        # code_files
-        for p in code_files:
-            cur.execute(
-                "INSERT INTO code_files(submission_id, filename, code) VALUES (?,?,?)",
-                (submission_id, str(p.relative_to(STUDENT_CODE_DIR)), read_file(p))
+def generate_all(bundles: list) -> None:
+    """Run every bundle's prompt through Ollama, at most OLLAMA_NUM_PARALLEL at once.
+
+    A failed prompt sets that bundle's ``error`` instead of aborting the others.
+    """
+    workers = max(1, min(OLLAMA_NUM_PARALLEL, len(bundles)))
+    options = ollama_options([b.prompt for b in bundles])   # identical for every request
+    with ThreadPoolExecutor(max_workers=workers) as ex:
+        futures = {
+            ex.submit(run_ollama, b.prompt, options): b for b in bundles
+        }
+        for fut, b in futures.items():
+            try:
+                b.feedback_text = fut.result()
+            except ControlCodeError as e:
+                b.error = str(e)
+
+def store_submissions(db: Repo, bundles: list, ts: str) -> None:
+    """Phase-1 rows (submissions, code_files, autograder_outputs) in one transaction."""
+    with db.transaction():
+        for b in bundles:
+            # submissions row — only a digest; the code itself lives in code_files
+            digest = hashlib.sha256(b.student_code_blob.encode("utf-8")).hexdigest()
+            b.submission_id = db.insert_submission(b.repo_name, digest, ts)
+
+            # code_files (multi-row VALUES, chunked)
+            db.insert_code_files(
+                (b.submission_id, str(p.relative_to(b.code_dir)), b.contents[p])
+                for p in b.code_files
             )
 
-        # autograder output
-        cur.execute(
-            "INSERT INTO autograder_outputs(submission_id, output, generated_at) "
-            "VALUES (?,?,?)",
-            (submission_id, autograder_out, ts)
-        )
+            # autograder output
+            db.insert_autograder_output(b.submission_id, b.autograder_out, ts)
 
-        # feedback (reviewed = 0)
-        cur.execute(
-            """INSERT INTO feedback
-                   (submission_id, repo_name, feedback_text, generated_at)
-               VALUES (?,?,?,?)""",
-            (submission_id, repo_name, feedback_text, ts)
+def store_feedback(db: Repo, bundles: list, ts: str) -> None:
+    """Feedback rows (reviewed = 0) for every bundle in one transaction."""
+    with db.transaction():
+        db.insert_feedback(
+            (b.submission_id, b.repo_name, b.feedback_text, ts) for b in bundles
         )
 
-        conn.commit()
-        print("✅ Data inserted into database")
-    except sqlite3.Error as e:
-        conn.rollback()
-        err(f"SQLite error → {e}")
+def main() -> None:
+    # 0️⃣ repo name(s)
+    if len(sys.argv) < 2:
+        err("Usage: control_code.py <repo_name> [<repo_name> ...]")
+    repo_names = sys.argv[1:]
+    # one repo → ~/logs/…; several → ~/logs/<repo_name>/… per repo
+    batched    = len(repo_names) > 1
+
+    ts   = datetime.utcnow().isoformat() + "Z"
+
+    try:
+        store   = PromptStore()  # uses PROMPTS_DIR (e.g., /app/prompts in Docker, $HOME/prompts in Actions)
+        bundles = []
+        skipped = []   # repos that got no feedback; reported via exit 1 at the end
+        for name in repo_names:
+            try:
+                bundles.append(
+                    process_repo(name, _DB, store, LOGS_DIR / name if batched else LOGS_DIR)
+                )
+            except ControlCodeError as e:
+                if not batched:
+                    raise
+                # one bad repo must not sink the whole batch
+                print(f"⚠️  Skipping {name}: {e}", file=sys.stderr)
+                skipped.append(name)
+        if not bundles:
+            err("No repos could be processed")
+
+        # 4️⃣  phase-1 DB rows (independent of the LLM) in a worker thread,
+        #     overlapping SQLite writes with model generation
+        phase1 = {}
+
+        def run_phase1() -> None:
+            try:
+                store_submissions(_DB, bundles, ts)
+            except BaseException as e:   # surfaced on the main thread after join()
+                phase1["error"] = e
+
+        def discard_phase1(dropped: list) -> None:
+            # best effort: a failing cleanup must not mask the original error
+            if "error" in phase1:
+                return
+            try:
+                _DB.delete_submissions(b.submission_id for b in dropped)
+            except sqlite3.Error as e:
+                print(f"⚠️  SQLite error removing rows without feedback → {e}",
+                      file=sys.stderr)
+
+        writer = threading.Thread(target=run_phase1, name="db-phase1")
+        writer.start()
+
+        # 5️⃣ call LLM — on failure, drop the phase-1 rows so nothing is left
+        #    without feedback (and a re-run does not add a second submission)
+        try:
+            generate_all(bundles)
+        except BaseException:
+            writer.join()
+            discard_phase1(bundles)
+            raise
+        writer.join()
+
+        failed  = [b for b in bundles if b.error]
+        bundles = [b for b in bundles if not b.error]
+        if failed:
+            discard_phase1(failed)
+        if not batched and failed:
+            err(failed[0].error)
+        for b in failed:
+            print(f"⚠️  Skipping {b.repo_name}: {b.error}", file=sys.stderr)
+            skipped.append(b.repo_name)
+        if not bundles:
+            err("No feedback could be generated")
+
+        # 6️⃣ write markdown (for GitHub commit)
+        for b in bundles:
+            b.feedback_md.write_text(f"# Feedback for {b.repo_name}\n\n{b.feedback_text}",
+                                     encoding="utf-8")
+            print(f"📄  Feedback saved → {b.feedback_md}")
+
+        # 7️⃣  feedback rows (reviewed = 0)
+        try:
+            if "error" in phase1:
+                raise phase1["error"]
+            store_feedback(_DB, bundles, ts)
+            print("✅ Data inserted into database")
+        except sqlite3.Error as e:
+            err(f"SQLite error → {e}")
+
+        if skipped:
+            err(f"No feedback for {len(skipped)} repo(s): {', '.join(skipped)}")
     finally:
-        conn.close()
+        _DB.close()
 
 if __name__ == "__main__":
-    main()
+    try:
+        main()
+    except ControlCodeError as e:
+        print(f"❌ {e}", file=sys.stderr)
+        sys.exit(1)
@@ -9,10 +9,14 @@ class PromptStore:
         base = base_dir or os.getenv("PROMPTS_DIR") or str(home_prompts)
         self.base = Path(base)
         self.default_name = default_name or os.getenv("PROMPT_DEFAULT", "system_default.md")
+        self._cache: dict[str, str] = {}  # filename -> stripped prompt text
 
     def read(self, filename: str | None = None) -> str:
         name = filename or self.default_name
+        if name in self._cache:
+            return self._cache[name]
         path = self.base / name
         if not path.is_file():
             raise FileNotFoundError(f"Prompt file not found: {path}")
-        return path.read_text(encoding="utf-8").strip()
+        text = self._cache[name] = path.read_text(encoding="utf-8").strip()
+        return text